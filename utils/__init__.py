@@ -0,0 +1,10 @@
+from .utils import (
+    aggregate_data,
+    build_genre_index,
+    downcast_columns,
+    filter_production_date,
+    filter_time_interval,
+    find_closest_match_ut,
+    generate_plots,
+    prepare_ratings,
+)
@@ -1,14 +1,125 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+import numpy as np
 import pandas as pd
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.cm import ScalarMappable
-from wordcloud import WordCloud
+_RANGE_MASK = None
+
+
+def _build_range_mask():
+    """
+    Use to pick, on first use, the implementation behind _range_mask: a
+    numba-compiled parallel loop if numba is installed, otherwise a numexpr
+    expression that evaluates the two comparisons and the & in a single pass,
+    otherwise plain numpy.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        pass
+    else:
+
+        @njit(parallel=True, cache=True, boundscheck=False)
+        def range_mask_jit(values, lo, hi):
+            out = np.empty(values.size, np.bool_)
+            for i in prange(values.size):
+                out[i] = lo <= values[i] <= hi
+            return out
+
+        return range_mask_jit
+
+    try:
+        import numexpr as ne
+    except ImportError:
+        pass
+    else:
+
+        def range_mask_numexpr(values, lo, hi):
+            return ne.evaluate("(values >= lo) & (values <= hi)")
+
+        return range_mask_numexpr
+
+    def range_mask_numpy(values, lo, hi):
+        return (values >= lo) & (values <= hi)
+
+    return range_mask_numpy
+
+
+def _range_mask(values: np.ndarray, lo, hi) -> np.ndarray:
+    """
+    Use to build the boolean mask lo <= values <= hi. The optional numba and
+    numexpr backends are only imported on the first call.
+    """
+    global _RANGE_MASK
+
+    if _RANGE_MASK is None:
+        _RANGE_MASK = _build_range_mask()
+
+    return _RANGE_MASK(values, lo, hi)
+
+
+def downcast_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Use right after loading a dataset to store movieId, movie_year and rating
+    with the narrowest dtypes that hold them, so that filters, groupbys and
+    merges move fewer bytes. Columns missing from df are skipped.
+    Args:
+        df: pandas df from the movies, ratings or tags datasets (or a merge).
+    Returns:
+        pandas df with movieId as int32, movie_year as int16 (float32 if some
+        years are missing) and rating as float32.
+    """
+    dtypes = {"movieId": "int32", "movie_year": "int16", "rating": "float32"}
+    if "movie_year" in df and df["movie_year"].isna().any():
+        dtypes["movie_year"] = "float32"
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df})
+
+
+_NS_PER_UNIT = {"s": 10**9, "ms": 10**6, "us": 10**3, "ns": 1}
+
+
+def _datetime_bound(
+    date: pd.Timestamp, unit: str, round_up: bool, tz_aware: bool = False
+) -> int:
+    """
+    Use to convert an interval bound to the int64 ticks of a datetime column
+    in the given unit (UTC based if the column is tz-aware). The lower bound is
+    rounded up and the upper bound down, so that comparing the ticks selects
+    the same rows as comparing the datetimes, and both are clamped to the
+    int64 range (NaT excluded).
+    """
+    if (date.tzinfo is not None) != tz_aware:
+        raise TypeError("Cannot compare tz-naive and tz-aware datetimes")
+
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc if tz_aware else None)
+    us = (date - epoch) // timedelta(microseconds=1)
+    ns = us * 1000 + date.nanosecond
+
+    per_tick = _NS_PER_UNIT[unit]
+    ticks = -(-ns // per_tick) if round_up else ns // per_tick
+
+    int64 = np.iinfo(np.int64)
+    return min(max(ticks, int64.min + 1), int64.max)
+
+
+def prepare_ratings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Use to sort the dataset once by datetime_rating, so that repeated calls to
+    filter_time_interval can slice it instead of scanning and sorting it.
+    Args:
+        df: pandas df with datetime_rating.
+    Returns:
+        pandas df sorted by datetime_rating (ascending, missing dates first)
+        with a fresh index.
+    """
+    # NaT is the smallest int64 tick, keep it first so the ticks stay sorted
+    return df.sort_values(by="datetime_rating", na_position="first").reset_index(
+        drop=True
+    )
 
 
 def filter_time_interval(
-    df: pd.DataFrame, start_date: datetime, end_date: datetime
+    df: pd.DataFrame, start_date: datetime, end_date: datetime, presorted: bool = False
 ) -> pd.DataFrame:
     """
     Use to filter the dataset based on time interval. The time interval has
@@ -16,13 +127,38 @@ def filter_time_interval(
     userId rated the movie right after watching it.
     Args:
         df: pandas df with datetime_rating (assumed to be approximately
-        the moment the movie has been watched), start_date, end_date.
+        the moment the movie has been watched), start_date, end_date,
+        presorted: True if df comes from prepare_ratings.
     Returns:
         pandas df filtered for a defined time interval.
     """
-    return df.loc[
-        (df.datetime_rating >= start_date) & (df.datetime_rating <= end_date)
-    ].sort_values(by="datetime_rating", ascending=False)
+    # accept the same bounds as a pandas comparison (datetime, Timestamp,
+    # datetime64 or str)
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    # work on the int64 ticks of the datetime array (UTC for tz-aware
+    # columns), with the bounds converted exactly to the same unit
+    dates = df["datetime_rating"].array
+    ticks = dates.asi8
+    tz_aware = dates.tz is not None
+    lo = _datetime_bound(start_date, dates.unit, round_up=True, tz_aware=tz_aware)
+    hi = _datetime_bound(end_date, dates.unit, round_up=False, tz_aware=tz_aware)
+
+    if presorted:
+        # binary search the interval bounds, reversing the slice gives the
+        # descending order without sorting
+        start = np.searchsorted(ticks, lo, side="left")
+        stop = np.searchsorted(ticks, hi, side="right")
+        return df.iloc[start:stop][::-1].reset_index(drop=True)
+
+    mask = _range_mask(ticks, lo, hi)
+
+    # sort only the reduced frame
+    return (
+        df.take(np.flatnonzero(mask))
+        .sort_values(by="datetime_rating", ascending=False)
+        .reset_index(drop=True)
+    )
 
 
 def filter_production_date(
@@ -37,51 +173,76 @@ def filter_production_date(
     Returns:
         pandas df filter by production movie year interval.
     """
-    return df.loc[(df.movie_year >= prod_start) & (df.movie_year <= prod_end)]
+    years = df["movie_year"].to_numpy()
+    mask = _range_mask(years, prod_start, prod_end)
 
+    return df.take(np.flatnonzero(mask)).reset_index(drop=True)
 
-def get_tags_per_movieId(movieId: int, tags_df: pd.DataFrame) -> list:
-    """
-    Use to get all tags per movieId
-    Args:
-        movieId
-        tags_df: dataframe from tags dataset
-    Returns:
-        list of tags per movieId.
-    """
-    return list(tags_df[tags_df.movieId == movieId]["tag"])
 
-
-def aggregate_data(df: pd.DataFrame, movies_df) -> pd.DataFrame:
+def aggregate_data(
+    df: pd.DataFrame, movies_df: pd.DataFrame, tags_df: pd.DataFrame
+) -> pd.DataFrame:
     """
     Use to aggregate total_views (count_views), average_ratings (rating_means), and get all tags collected per movieId
     Arg:
         df: dataframe with preferred time interval already defined
-        movies_df: dataframe from the movies dataset
+        movies_df: dataframe from the movies dataset, optionally indexed by
+        movieId once at load (set_index("movieId"))
+        tags_df: dataframe from the tags dataset
     Returns:
-        a copy datframe of movies_df
+        dataframe with one row per movie of movies_df that appears in df, with
+        its total_views, average_rating and tags
     """
 
-    movies_df_copy = movies_df.copy()
-
-    count_views = pd.DataFrame(df.groupby("movieId")["movieId"].count()).rename(
-        columns={"movieId": "total_views"}
+    # total views and average rating in a single groupby pass
+    agg_df = df.groupby("movieId", sort=False, observed=True).agg(
+        total_views=("movieId", "size"), average_rating=("rating", "mean")
     )
 
-    rating_means = pd.DataFrame(df.groupby("movieId")["rating"].mean()).rename(
-        columns={"rating": "average_rating"}
-    )
+    # agg_df is indexed by movieId, so join on the movies_df index if it is
+    # already indexed by movieId, otherwise merge on the movieId column
+    if movies_df.index.name == "movieId":
+        aggregate_df = movies_df.join(agg_df, how="inner")
+        movie_ids = aggregate_df.index
+    else:
+        aggregate_df = movies_df.merge(agg_df, on="movieId", how="inner")
+        movie_ids = aggregate_df["movieId"]
 
-    movies_df_copy = pd.merge(movies_df, count_views, on="movieId")
+    # get all tags per movieId, grouping the tags dataset once
+    tags_by_id = tags_df.groupby("movieId", sort=False)["tag"].agg(list).to_dict()
+    aggregate_df["tags"] = [tags_by_id.get(movie_id, []) for movie_id in movie_ids]
 
-    movies_df_copy = pd.merge(movies_df_copy, rating_means, on="movieId")
+    # go back to a RangeIndex, keeping movieId as a column
+    return aggregate_df.reset_index(drop="movieId" in aggregate_df.columns)
 
-    # get all tags per movieId
-    movies_df_copy["tags"] = movies_df_copy["movieId"].apply(
-        lambda x: get_tags_per_movieId(x)
-    )
 
-    return movies_df_copy
+_WORDCLOUD = None
+_FIGURE = None
+_AXES = None
+
+
+def _get_plot_canvas():
+    """
+    Use to reuse the word cloud and the figure of generate_plots across calls.
+    The figure is created again if it has been closed, otherwise its axes are
+    cleared. The inline notebook backend closes figures once shown, so there
+    only the word cloud is reused.
+    """
+    global _WORDCLOUD, _FIGURE, _AXES
+
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
+    if _WORDCLOUD is None:
+        _WORDCLOUD = WordCloud(width=800, height=400)
+
+    if _FIGURE is None or not plt.fignum_exists(_FIGURE.number):
+        _FIGURE, _AXES = plt.subplots(3, 1, figsize=(10, 15))
+    else:
+        for ax in _AXES:
+            ax.clear()
+
+    return _WORDCLOUD, _FIGURE, _AXES
 
 
 def generate_plots(movies_df: pd.DataFrame, genre: str, decade: int, top: int = 20):
@@ -89,24 +250,28 @@ def generate_plots(movies_df: pd.DataFrame, genre: str, decade: int, top: int =
     Use to generate insights based on movies_df. By default, the insights will
     be generated based on the top 20 movies.
     """
+    # plotting libraries are only imported once plots are generated
+    import matplotlib.pyplot as plt
 
-    # sample data
-    movies_df = movies_df.sort_values(by="total_views", ascending=False).head(top)
+    # sample data, already sorted by total views (descending)
+    movies_df = movies_df.nlargest(top, "total_views")
+    ratings_arr = movies_df["average_rating"].to_numpy()
+    views_arr = movies_df["total_views"].to_numpy()
 
     # define colors for shading based on ratings
     cmap = plt.cm.get_cmap("viridis", 10)  # Choose a colormap with 10 shades
-    ratings = movies_df["average_rating"]  # Ratings data from your dataframe
-    normalized_ratings = (ratings - 1) / 4  # Normalize ratings to range [0,1]
-    colors = cmap.reversed()(normalized_ratings)  # Reverse the colormap
-
-    # create a figure with three subplots
-    fig, axs = plt.subplots(3, 1, figsize=(10, 15))
+    cmap_reversed = cmap.reversed()  # Reverse the colormap
+    normalized_ratings = (ratings_arr - 1) / 4  # Normalize ratings to range [0,1]
+    colors = cmap_reversed(normalized_ratings)  # RGBA array, one row per movie
 
     # reduce alpha value to increase contrast of bars
-    colors = [(c[0], c[1], c[2], 0.7) for c in colors]  # Set alpha value to 0.7
+    colors[:, 3] = 0.7  # Set alpha value to 0.7
+
+    # get the word cloud and a figure with three subplots
+    wordcloud, fig, axs = _get_plot_canvas()
 
     # plot the horizontal bar chart on the first subplot
-    barh = axs[0].barh(movies_df["title"], movies_df["total_views"], color=colors)
+    barh = axs[0].barh(movies_df["title"], views_arr, color=colors)
     axs[0].set_xlabel("Total views")
     axs[0].set_title(
         f"Total Views by Top {genre} {top} movies produced in the {decade}s and Average Ratings",
@@ -115,19 +280,20 @@ def generate_plots(movies_df: pd.DataFrame, genre: str, decade: int, top: int =
 
     # create a custom legend for the first subplot
     legend_labels = [
-        plt.Line2D([0], [0], color=cmap.reversed()(0.2), lw=6),
-        plt.Line2D([0], [0], color=cmap.reversed()(0.5), lw=6),
-        plt.Line2D([0], [0], color=cmap.reversed()(0.8), lw=6),
+        plt.Line2D([0], [0], color=cmap_reversed(0.2), lw=6),
+        plt.Line2D([0], [0], color=cmap_reversed(0.5), lw=6),
+        plt.Line2D([0], [0], color=cmap_reversed(0.8), lw=6),
     ]
     legend_texts = ["Low Rating (<3)", "Medium Rating (3)", "High Rating (>3)"]
     axs[0].legend(legend_labels, legend_texts, loc="upper right")
 
-    # add rating labels inside the bars in the first subplot
-    for i, bar in enumerate(barh):
-        rating = movies_df.iloc[i]["average_rating"]
+    # add rating labels inside the bars in the first subplot, the bar widths
+    # being the plotted views
+    bar_centers = [bar.get_y() + bar.get_height() / 2 for bar in barh]
+    for width, y, rating in zip(views_arr, bar_centers, ratings_arr):
         axs[0].text(
-            bar.get_width() - 0.2,
-            bar.get_y() + bar.get_height() / 2,
+            width - 0.2,
+            y,
             f"{rating:.1f}",
             color="white",
             ha="right",
@@ -135,11 +301,7 @@ def generate_plots(movies_df: pd.DataFrame, genre: str, decade: int, top: int =
         )
 
     # plot the scatter plot on the second subplot
-    axs[1].scatter(
-        movies_df.sort_values(by="total_views", ascending=False)["average_rating"],
-        movies_df.sort_values(by="total_views", ascending=False)["total_views"],
-        color="green",
-    )
+    axs[1].scatter(ratings_arr, views_arr, color="green")
     axs[1].set_xlabel("Average Rating")
     axs[1].set_ylabel("Total Views")
     axs[1].set_title(
@@ -148,23 +310,69 @@ def generate_plots(movies_df: pd.DataFrame, genre: str, decade: int, top: int =
     )
 
     # generate the word cloud from the "tags" column on the third subplot
-    wordcloud = WordCloud(width=800, height=400).generate(
-        " ".join(movies_df["tags"].explode().dropna())
-    )
+    # join the tag lists directly, skipping missing tags, without exploding them
+    tags = chain.from_iterable(movies_df["tags"].dropna())
+    wordcloud.generate(" ".join(tag for tag in tags if isinstance(tag, str)))
 
     # plot the word cloud on the third subplot
     axs[2].imshow(wordcloud, interpolation="bilinear")
     axs[2].axis("off")
     axs[2].set_title(f"Tags generated by the users for these movies", fontweight="bold")
 
- 
-    plt.tight_layout()
+    # lay out and show the cached figure, which may not be the current one
+    fig.tight_layout()
+    plt.figure(fig.number)
+    plt.show()
+
+
+def build_genre_index(dataset: pd.DataFrame) -> pd.DataFrame:
+    """
+    Use to build, once per dataset, a compact long-form table with one row per
+    (movieId, genre) pair, so that genre lookups don't need to explode the
+    dataset on every query.
+    Args:
+        dataset: pandas df with movieId and genres (list of genres per row).
+    Returns:
+        pandas df with movieId (int32) and genres (categorical).
+    """
+    # pyarrow is only imported when the genre index is built
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    movies = dataset[["movieId", "genres"]].drop_duplicates(subset="movieId")
+
+    # flatten the genre lists in arrow and dictionary-encode the labels
+    genre_lists = pa.array(
+        movies["genres"], type=pa.list_(pa.string()), from_pandas=True
+    )
+    genres = pc.list_flatten(genre_lists).dictionary_encode()
+    parents = pc.list_parent_indices(genre_lists).to_numpy()
+
+    return pd.DataFrame(
+        {
+            "movieId": movies["movieId"].to_numpy()[parents].astype(np.int32),
+            "genres": pd.Categorical.from_codes(
+                pc.fill_null(genres.indices, -1).to_numpy(),
+                categories=genres.dictionary.to_pylist(),
+            ),
+        }
+    )
 
 
-    plt.show
+def _genre_mask(genres: pd.Categorical, genre: str) -> np.ndarray:
+    """
+    Use to match categorical genres against a single genre label by comparing
+    the category codes.
+    """
+    categories = genres.categories
+    if genre not in categories:
+        return np.zeros(len(genres), dtype=bool)
+    return genres.codes == categories.get_loc(genre)
 
 
-def find_closest_match_ut(genre, prod_year, dataset):
+def find_closest_match_ut(
+    genre, prod_year, dataset, movies_df, tags_df, genre_index=None
+):
     """
     Compare a proposed new movie against similar movies in the dataset and
     visualize how the similar movies behaved.
@@ -173,9 +381,15 @@ def find_closest_match_ut(genre, prod_year, dataset):
         genre (str): Genre of the proposed new movie.
         prod_year (int): Production year of the proposed new movie.
         dataset (pd.DataFrame): Dataset of movies to compare against.
+        movies_df (pd.DataFrame): Dataframe from the movies dataset.
+        tags_df (pd.DataFrame): Dataframe from the tags dataset.
+        genre_index (pd.DataFrame, optional): Output of build_genre_index for
+            this dataset. If given, the dataset is not exploded to match the
+            genre; filter_df is the same either way.
 
     Returns:
-        filter_df (pd.DataFrame): Filtered dataframe per genre and decade.
+        filter_df (pd.DataFrame): Filtered dataframe per genre and decade, one
+            row per match with the matched genre in genres.
         aggregate_df (pd.DataFrame): Aggregated data for visualization.
     """
 
@@ -184,10 +398,24 @@ def find_closest_match_ut(genre, prod_year, dataset):
 
     # filter df per start and end decade (+9 yrs)
     filter_df = filter_production_date(dataset, decade, decade + 9)
-    filter_df = filter_df.explode("genres")
-    filter_df = filter_df[filter_df["genres"].str.contains(genre)]
 
-    aggregate_df = aggregate_data(filter_df)
+    if genre_index is not None:
+        # keep the rows whose movieId is listed under the genre, labelled with
+        # the genre as the exploded rows below would be
+        movie_ids = genre_index["movieId"].to_numpy()[
+            _genre_mask(genre_index["genres"].array, genre)
+        ]
+        mask = filter_df["movieId"].isin(movie_ids).to_numpy()
+        filter_df = filter_df.take(np.flatnonzero(mask)).reset_index(drop=True)
+        filter_df["genres"] = genre
+    else:
+        # explode leaves one genre label per row, so match on the category codes
+        # of a local categorical, keeping the genres column as is
+        filter_df = filter_df.explode("genres")
+        mask = _genre_mask(pd.Categorical(filter_df["genres"]), genre)
+        filter_df = filter_df.take(np.flatnonzero(mask)).reset_index(drop=True)
+
+    aggregate_df = aggregate_data(filter_df, movies_df, tags_df)
 
     generate_plots(aggregate_df, genre, decade)
 